@@ -17,6 +17,7 @@ def build_model(cfg, registry, **kwargs):
     if not isinstance(cfg, dict):
         raise TypeError(f"config must be type dict, got {type(cfg)}")
     if "pretrain" in cfg:
+        cfg = dict(cfg)
         pretrain_cfg = cfg.pop("pretrain")
         if pretrain_cfg is not None:
             if not isinstance(pretrain_cfg, (dict, str)):
@@ -35,6 +36,7 @@ def build_model(cfg, registry, **kwargs):
     else:
         if "path" not in pretrain_cfg:
             raise KeyError("Expected key path in pretrain dict")
+        pretrain_cfg = dict(pretrain_cfg)
 
     # Get the model to local file
     path = pretrain_cfg.pop("path")
@@ -52,8 +52,11 @@ _RESERVE_KEY = "_reserve_"
 
 class ValueComment(object):
     """ Add a comment to the value.
+    Instances may be shared, e.g. by registry introspection results, treat them as immutable.
     """
 
+    __slots__ = ('value', 'comment')
+
     def __init__(self, value, comment):
         self.value = value
         self.comment = comment
@@ -15,16 +15,55 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import copy
 import inspect
+import re
+import sys
 import types
 import warnings
-from collections import OrderedDict
-
-from docstring_parser import parser
+import weakref
 
 from .config import ValueComment
 
+# Introspection results are immutable for the lifetime of a class or function,
+# weak keys let dynamically created ones be garbage collected.
+_CLASS_ARGS_CACHE = weakref.WeakKeyDictionary()
+_FUNC_ARGS_CACHE = weakref.WeakKeyDictionary()
+_ANCESTOR_ARGS_CACHE = weakref.WeakKeyDictionary()
+
+# docstring_parser is imported on first use, only introspection needs it
+_docstring_parser = None
+
+# Module level aliases, saves attribute lookups in introspection loops
+_EMPTY = inspect.Parameter.empty
+_POK = inspect.Parameter.POSITIONAL_OR_KEYWORD
+_VAR_KW = inspect.Parameter.VAR_KEYWORD
+_VAR_POS = inspect.Parameter.VAR_POSITIONAL
+_signature = inspect.signature
+_isclass = inspect.isclass
+_isfunction = inspect.isfunction
+
+_MISSING_ENTRY = (None, False)
+_EMPTY_DOC_PARAMS = types.MappingProxyType({})
+_EMPTY_KWARGS = types.MappingProxyType({})
+# Google style docstring sections, same as docstring_parser.google
+_GOOGLE_TITLES_RE = re.compile(r"^(Arguments|Args|Parameters|Params|Raises|Exceptions|Except|Attributes|"
+                               r"Example|Examples|Returns|Yields):[ \t\r\f\v]*$", re.M)
+_GOOGLE_PARAM_TITLES = frozenset(("Arguments", "Args", "Parameters", "Params", "Attributes"))
+_GOOGLE_SINGULAR_TITLES = frozenset(("Example", "Examples", "Returns", "Yields"))
+_GOOGLE_TYPED_ARG_RE = re.compile(r"\s*(.+?)\s*\(\s*(.*[^\s]+)\s*\)")
+_UNKNOWN_META_RE = re.compile(r"\n\S")
+_INDENT_RE = re.compile(r"\s*")
+# Markers of other docstring styles, which docstring_parser may prefer to Google style
+_OTHER_STYLE_RE = re.compile(r"^\s*([:@]\w|\.\. |-{3,}\s*$)", re.M)
+
+# Shared values of **kwargs and *args parameters
+_EMPTY_DICT_VC = ValueComment(dict(), '')
+_EMPTY_LIST_VC = ValueComment(list(), '')
+
+# Only these annotations, or generic aliases of them such as List[int], are constructed to get a default value,
+# arbitrary types may be expensive or fail
+_ANNOTATION_DEFAULT_TYPES = frozenset((int, float, str, bool, list, dict, tuple, set, frozenset, bytes))
+
 
 def build_from_config(cfg, registry, **kwargs):
     """ Default builder function.
@@ -43,42 +82,125 @@ def build_from_config(cfg, registry, **kwargs):
         KeyError:
         Exception:
     """
+    if not isinstance(registry, Registry):
+        raise TypeError(f"registry must be type Registry, got {type(registry)}")
+    return _build_from_config(cfg, registry, kwargs)
+
+
+def _build_from_config(cfg, registry, kwargs):
+    """ Same as build_from_config, but registry is known to be a Registry and kwargs is passed as a mapping.
+    """
     if not isinstance(cfg, dict):
         raise TypeError(f"config must be type dict, got {type(cfg)}")
     if "type" not in cfg:
         raise KeyError(f"config must contain key type, got {cfg}")
-    if not isinstance(registry, Registry):
-        raise TypeError(f"registry must be type Registry, got {type(registry)}")
 
-    cfg = copy.deepcopy(cfg)
+    # Shallow copy without key type, caller's config will not be modified
+    req_type = cfg["type"]
+    cfg = {key: value for key, value in cfg.items() if key != "type"}
+    if kwargs:
+        cfg.update(kwargs)
 
-    req_type = cfg.pop("type")
-    req_type_entry = req_type
     if isinstance(req_type, str):
-        req_type_entry = registry.get(req_type)
+        req_type_entry, is_class = registry.get_with_kind(req_type)
         if req_type_entry is None:
             raise KeyError(f"{req_type} not found in {registry.name} registry")
+    else:
+        req_type_entry = req_type
+        is_class = isinstance(req_type, type)
+        if not is_class and not isinstance(req_type, types.FunctionType):
+            raise TypeError(f"type must be str or class, got {type(req_type_entry)}")
 
-    if kwargs is not None:
-        cfg.update(kwargs)
-
-    if inspect.isclass(req_type_entry):
+    if is_class:
         try:
             return req_type_entry(**cfg)
         except Exception as e:
             raise Exception(f"Failed to init class {req_type_entry}, with {e}")
-    elif inspect.isfunction(req_type_entry):
+    else:
         try:
             return req_type_entry(**cfg)
         except Exception as e:
             raise Exception(f"Failed to invoke function {req_type_entry}, with {e}")
-    else:
-        raise TypeError(f"type must be str or class, got {type(req_type_entry)}")
+
+
+def _intern_name(name):
+    # sys.intern only accepts exact str, other hashable names are stored unchanged
+    return sys.intern(name) if type(name) is str else name
+
+
+def _warn_replaced(kind, name, prev, instance):
+    warnings.warn(f"{kind} {name} already registered by {prev}, will be replaced by {instance}")
+
+
+def _parse_google_params(doc_str):
+    """ Scan parameters of a Google style docstring, same as docstring_parser but without parsing other styles.
+
+    Returns:
+        A dict of parameter name to description,
+        None if doc_str is in another style or rejected by Google style rules, and should be parsed by docstring_parser.
+    """
+    text = inspect.cleandoc(doc_str)
+    if _OTHER_STYLE_RE.search(text):
+        return None
+    matches = list(_GOOGLE_TITLES_RE.finditer(text))
+    if not matches:
+        # Plain prose, no style documents parameters
+        return {}
+
+    # A repeated section title replaces the former section
+    chunks = {}
+    for i, match in enumerate(matches):
+        chunk = text[match.end():matches[i + 1].start() if i + 1 < len(matches) else len(text)]
+        # Section ends at the first unindented line
+        unknown_meta = _UNKNOWN_META_RE.search(chunk)
+        if unknown_meta is not None:
+            chunk = chunk[:unknown_meta.start()]
+        chunks[match.group(1)] = chunk.strip('\n')
+
+    ret = {}
+    for title, chunk in chunks.items():
+        if title in _GOOGLE_SINGULAR_TITLES:
+            continue
+        # Items start at lines with exactly the indent of the first line
+        indent = _INDENT_RE.match(chunk).group()
+        items = list(re.finditer('^' + indent + r'(?=\S)', chunk, flags=re.M))
+        if not items:
+            return None
+        ends = [item.start() for item in items[1:]] + [len(chunk)]
+        for item, end in zip(items, ends):
+            part = chunk[item.end():end].strip('\n')
+            if ':' not in part:
+                return None
+            if title not in _GOOGLE_PARAM_TITLES:
+                continue
+            before, desc = part.split(':', 1)
+            if desc:
+                desc = desc[1:] if desc[0] == ' ' else desc
+                if '\n' in desc:
+                    first_line, rest = desc.split('\n', 1)
+                    desc = first_line + '\n' + inspect.cleandoc(rest)
+                desc = desc.strip('\n')
+            typed_match = _GOOGLE_TYPED_ARG_RE.match(before)
+            ret[typed_match.group(1) if typed_match else before] = desc
+    return ret
 
 
 def _get_doc_params(doc_str):
-    doc = parser.parse(doc_str)
-    ret = OrderedDict()
+    global _docstring_parser
+    # Too short to document any parameter
+    if not doc_str or len(doc_str) < 8:
+        return _EMPTY_DOC_PARAMS
+    ret = _parse_google_params(doc_str)
+    if ret is not None:
+        return ret
+    if _docstring_parser is None:
+        try:
+            from docstring_parser import parser as _docstring_parser
+        except ImportError as e:
+            raise ImportError("Parsing docstring needs package docstring_parser, "
+                              "install it by `pip install essmc2[registry]`") from e
+    doc = _docstring_parser.parse(doc_str)
+    ret = {}
     for param in doc.params:
         name = param.arg_name
         desc = param.description
@@ -87,87 +209,108 @@ def _get_doc_params(doc_str):
     return ret
 
 
-def get_class_arguments(cls):
-    args = OrderedDict()
+def _annotation_default_type(annotation):
+    """ Get the allowed builtin type to construct a default value from annotation, None if not allowed.
+    """
+    try:
+        if annotation in _ANNOTATION_DEFAULT_TYPES:
+            return annotation
+    except TypeError:
+        # Unhashable annotation such as a list instance, no default can be derived from it
+        return None
+    origin = getattr(annotation, '__origin__', None)
+    return origin if origin in _ANNOTATION_DEFAULT_TYPES else None
+
+
+def _param_to_value_comment(param, scope_name, param_doc_dict):
+    """ Convert an inspect.Parameter to a ValueComment of its default value and documentation.
+    """
+    default_value = None
+    default_doc = ""
 
-    for type_c in cls.__mro__:
-        param_doc_dict = _get_doc_params(type_c.__doc__)
-        parameters = {key: value for key, value in inspect.signature(type_c.__init__).parameters.items() if
-                      key != 'self'}
-        for key, value in parameters.items():
-            if value.kind != inspect.Parameter.POSITIONAL_OR_KEYWORD:
-                continue
-            if key in args:
-                continue
+    if param.default is not _EMPTY:
+        default_value = param.default
+    else:
+        default_doc = f"TODO: Complete this value for type {scope_name}"
+        annotation = _annotation_default_type(param.annotation)
+        if annotation is not None:
+            default_value = annotation()
+            default_doc += f", use default from type {annotation.__name__}()"
+        default_doc += "."
+
+    doc = param_doc_dict.get(param.name)
+    if doc is not None:
+        if '\n' not in doc or len(default_doc) == 0:
+            default_doc += doc
+        else:
+            default_doc += ('\n' + doc)
 
-            default_value = None
-            default_doc = ""
+    return ValueComment(default_value, default_doc)
 
-            if value.default != inspect.Parameter.empty:
-                default_value = value.default
-            else:
-                default_doc = f"TODO: Complete this value for type {type_c.__name__}"
-                if value.annotation != inspect.Parameter.empty:
-                    try:
-                        try_value = value.annotation()
-                        default_value = try_value
-                        default_doc += f", use default from type {value.annotation.__name__}()"
-                    except:
-                        pass
-                default_doc += "."
-
-            if key in param_doc_dict:
-                doc = param_doc_dict[key]
-                if len(doc.split('\n')) <= 1 or len(default_doc) == 0:
-                    default_doc += doc
-                else:
-                    default_doc += ('\n' + doc)
 
-            args[key] = ValueComment(default_value, default_doc)
+def _ancestor_args(type_c):
+    """ Get arguments declared by __init__ of type_c itself, shared by all of its subclasses.
+    """
+    args = _ANCESTOR_ARGS_CACHE.get(type_c)
+    if args is not None:
+        return args
+
+    args = {}
+    param_doc_dict = _get_doc_params(type_c.__doc__)
+    for key, value in _signature(type_c.__init__).parameters.items():
+        if key == 'self' or value.kind != _POK:
+            continue
+        args[key] = _param_to_value_comment(value, type_c.__name__, param_doc_dict)
+
+    _ANCESTOR_ARGS_CACHE[type_c] = args
+    return args
+
+
+def get_class_arguments(cls):
+    """ Get arguments of class cls, results are cached and should not be modified.
+    """
+    args = _CLASS_ARGS_CACHE.get(cls)
+    if args is not None:
+        return args
+
+    args = {}
+
+    for type_c in cls.__mro__:
+        if type_c is object or type_c is type:
+            continue
+        for key, value in _ancestor_args(type_c).items():
+            if key not in args:
+                args[key] = value
+
+    _CLASS_ARGS_CACHE[cls] = args
     return args
 
 
 def get_function_arguments(func):
-    args = OrderedDict()
+    """ Get arguments of function func, results are cached and should not be modified.
+    """
+    args = _FUNC_ARGS_CACHE.get(func)
+    if args is not None:
+        return args
+
+    args = {}
 
-    parameters = inspect.signature(func).parameters
+    parameters = _signature(func).parameters
     param_doc_dict = _get_doc_params(func.__doc__)
 
     for key, value in parameters.items():
-        if value.kind == inspect.Parameter.VAR_KEYWORD:
-            args[key] = ValueComment(dict(), '')
+        if value.kind == _VAR_KW:
+            args[key] = _EMPTY_DICT_VC
             continue
-        elif value.kind == inspect.Parameter.VAR_POSITIONAL:
-            args[key] = ValueComment(list(), '')
+        elif value.kind == _VAR_POS:
+            args[key] = _EMPTY_LIST_VC
             continue
-        elif value.kind != inspect.Parameter.POSITIONAL_OR_KEYWORD:
+        elif value.kind != _POK:
             continue
 
-        default_value = None
-        default_doc = ""
-
-        if value.default != inspect.Parameter.empty:
-            default_value = value.default
-        else:
-            default_doc = f"TODO: Complete this value for type {func.__name__}"
-            if value.annotation != inspect.Parameter.empty:
-                try:
-                    try_value = value.annotation()
-                    default_value = try_value
-                    default_doc += f", use default from type {value.annotation.__name__}()"
-                except:
-                    pass
-            default_doc += "."
-
-        if key in param_doc_dict:
-            doc = param_doc_dict[key]
-            if len(doc.split('\n')) <= 1 or len(default_doc) == 0:
-                default_doc += doc
-            else:
-                default_doc += ('\n' + doc)
-
-        args[key] = ValueComment(default_value, default_doc)
+        args[key] = _param_to_value_comment(value, func.__name__, param_doc_dict)
 
+    _FUNC_ARGS_CACHE[func] = args
     return args
 
 
@@ -191,51 +334,80 @@ class Registry(object):
         name (str): Registry name.
         build_func (func, None): Instance construct function. Default is build_from_config.
         allow_types (tuple): Indicates how to construct the instance, by constructing class or invoking function.
+        lazy_schema (bool): If False, compute parameters of classes and functions when registering them,
+            otherwise compute them on the first fetch_parameters() call. Default is True.
     """
 
+    __slots__ = ('name', 'allow_types', 'class_map', 'func_map', 'class_args_map', 'func_args_map', '_dispatch',
+                 'build_func', 'lazy_schema')
+
     REGISTRY_LIST = []
 
-    def __init__(self, name, build_func=None, allow_types=("class", "function")):
+    def __init__(self, name, build_func=None, allow_types=("class", "function"), lazy_schema=True):
         self.name = name
         self.allow_types = allow_types
-        self.class_map = OrderedDict()
-        self.func_map = OrderedDict()
+        self.class_map = {}
+        self.func_map = {}
+        self.class_args_map = {}
+        self.func_args_map = {}
+        # Merged name -> (class or function, is_class) table for lookups,
+        # class_map and func_map are kept for introspection
+        self._dispatch = {}
         self.build_func = build_func or build_from_config
+        self.lazy_schema = lazy_schema
 
         Registry.REGISTRY_LIST.append(self)
 
     def get(self, req_type):
-        return self.class_map.get(req_type) or self.func_map.get(req_type)
+        return self._dispatch.get(req_type, _MISSING_ENTRY)[0]
+
+    def get_with_kind(self, req_type):
+        """ Get registered class or function, and whether it is a class.
+        Args:
+            req_type (str): Required type name.
+
+        Returns:
+            A tuple (class or function, is_class), (None, False) if req_type not found.
+        """
+        return self._dispatch.get(req_type, _MISSING_ENTRY)
 
     def build(self, *args, **kwargs):
+        if len(args) == 1 and self.build_func is build_from_config:
+            return _build_from_config(args[0], self, kwargs)
         return self.build_func(*args, **kwargs, registry=self)
 
+    def build_cfg(self, cfg):
+        """ Build instance from a single config dict without extra arguments.
+        Args:
+            cfg (dict): Config dict which contains key type.
+
+        Returns:
+            Instance built by build_func.
+        """
+        if self.build_func is build_from_config:
+            return _build_from_config(cfg, self, _EMPTY_KWARGS)
+        return self.build_func(cfg, registry=self)
+
     def register_class(self, name=None):
         def _register(cls):
-            if not inspect.isclass(cls):
+            if not _isclass(cls):
                 raise TypeError(f"Module must be type class, got {type(cls)}")
             if "class" not in self.allow_types:
                 raise TypeError(f"Register {self.name} only allows type {self.allow_types}, got class")
-            module_name = name or cls.__name__
-            if module_name in self.class_map:
-                warnings.warn(f"Class {module_name} already registered by {self.class_map[module_name]}, "
-                              f"will be replaced by {cls}")
-            self.class_map[module_name] = cls
+            module_name = _intern_name(name or cls.__name__)
+            self._register_instance(module_name, cls, True)
             return cls
 
         return _register
 
     def register_function(self, name=None):
         def _register(func):
-            if not inspect.isfunction(func):
+            if not _isfunction(func):
                 raise TypeError(f"Registry must be type function, got {type(func)}")
             if "function" not in self.allow_types:
                 raise TypeError(f"Registry {self.name} only allows type {self.allow_types}, got function")
-            func_name = name or func.__name__
-            if func_name in self.func_map:
-                warnings.warn(f"Function {func_name} already registered by {self.func_map[func_name]}, "
-                              f"will be replaced by {func}")
-            self.func_map[func_name] = func
+            func_name = _intern_name(name or func.__name__)
+            self._register_instance(func_name, func, False)
             return func
 
         return _register
@@ -247,62 +419,87 @@ class Registry(object):
             name (Optional[str]):
 
         """
-        if inspect.isfunction(instance) and isinstance(instance, types.LambdaType) and instance.__name__ == "<lambda>":
+        if _isfunction(instance) and isinstance(instance, types.LambdaType) and instance.__name__ == "<lambda>":
             if name is None:
                 raise ValueError("Lambda function needs a explicit name, got None")
 
-        name = name or instance.__name__
+        name = _intern_name(name or instance.__name__)
 
-        if inspect.isfunction(instance):
+        if _isfunction(instance):
             if "function" not in self.allow_types:
                 raise TypeError(f"Registry {name} only allows type {self.allow_types}, got function")
 
-            if name in self.func_map:
-                warnings.warn(f"Function {name} already registered by {self.func_map[name]}, "
-                              f"will be replaced by {instance}")
-
-            self.func_map[name] = instance
+            self._register_instance(name, instance, False)
 
-        elif inspect.isclass(instance):
+        elif _isclass(instance):
             if "class" not in self.allow_types:
                 raise TypeError(f"Registry {name} only allows type {self.allow_types}, got class")
 
-            if name in self.class_map:
-                warnings.warn(f"Class {name} already registered by {self.class_map[name]}, "
-                              f"will be replaced by {instance}")
-
-            self.class_map[name] = instance
+            self._register_instance(name, instance, True)
 
         else:
             raise TypeError(f"Expect instance to be a function or a class, got {type(instance)}")
 
+    def _register_instance(self, name, instance, is_class):
+        if is_class:
+            instance_map, args_map, get_arguments = self.class_map, self.class_args_map, get_class_arguments
+        else:
+            instance_map, args_map, get_arguments = self.func_map, self.func_args_map, get_function_arguments
+        prev, prev_is_class = self._dispatch.get(name, _MISSING_ENTRY)
+        if prev is not None:
+            _warn_replaced("Class" if is_class else "Function", name, prev, instance)
+            if prev_is_class != is_class:
+                # Keep all tables in agreement on the replaced name
+                if prev_is_class:
+                    self.class_map.pop(name)
+                    self.class_args_map.pop(name, None)
+                else:
+                    self.func_map.pop(name)
+                    self.func_args_map.pop(name, None)
+        instance_map[name] = instance
+        self._dispatch[name] = (instance, is_class)
+        self._update_arguments(args_map, name, instance, get_arguments)
+
+    def _update_arguments(self, args_map, name, instance, get_arguments):
+        args_map.pop(name, None)
+        if self.lazy_schema:
+            return
+        try:
+            args_map[name] = get_arguments(instance)
+        except Exception as e:
+            warnings.warn(f"Failed to get parameters of {name} in {self.name} registry, with {e}")
+
     def fetch_parameters(self, req_type):
         """ Get full parameter dict of required req_type.
         Args:
             req_type (str): Required type name.
 
         Returns:
-            An ordered dict of arguments, including default value and some comments.
+            A dict of arguments in declaration order, including default value and some comments.
         """
-        if req_type in self.class_map:
-            return get_class_arguments(self.class_map[req_type])
+        if req_type in self.class_args_map:
+            return self.class_args_map[req_type]
+        elif req_type in self.func_args_map:
+            return self.func_args_map[req_type]
+        elif req_type in self.class_map:
+            args = self.class_args_map[req_type] = get_class_arguments(self.class_map[req_type])
+            return args
         elif req_type in self.func_map:
-            return get_function_arguments(self.func_map[req_type])
+            args = self.func_args_map[req_type] = get_function_arguments(self.func_map[req_type])
+            return args
         else:
             raise ValueError(f"Unexpected type {req_type}")
 
     def contains(self, req_type):
-        return req_type in self.class_map or req_type in self.func_map
+        return req_type in self._dispatch
 
     def _list(self):
-        keys = sorted(list(self.class_map.keys()) + list(self.func_map.keys()))
         descriptions = []
-        for key in keys:
-            if key in self.class_map:
-                descriptions.append(f"{key}: {self.class_map[key]}")
+        for key, (instance, is_class) in sorted(self._dispatch.items()):
+            if is_class:
+                descriptions.append(f"{key}: {instance}")
             else:
-                descriptions.append(
-                    f"{key}: <function '{self.func_map[key].__module__}.{self.func_map[key].__name__}'>")
+                descriptions.append(f"{key}: <function '{instance.__module__}.{instance.__name__}'>")
         return "\n".join(descriptions)
 
     def __repr__(self):
@@ -0,0 +1,250 @@
+import sys
+import warnings
+from typing import List, Optional
+
+import pytest
+
+from essmc2.utils.registry import Registry, get_class_arguments, get_function_arguments
+
+TEST_REGISTRY = Registry("TEST_REGISTRY")
+
+
+@pytest.fixture
+def make_registry():
+    """ Create registries which are removed from Registry.REGISTRY_LIST after the test.
+    """
+    registries = []
+
+    def _make_registry(*args, **kwargs):
+        registry = Registry(*args, **kwargs)
+        registries.append(registry)
+        return registry
+
+    yield _make_registry
+    for registry in registries:
+        Registry.REGISTRY_LIST.remove(registry)
+
+
+@TEST_REGISTRY.register_class()
+class Foo(object):
+    """ A test class.
+
+    Args:
+        a (int): Value a.
+        b (str): Value b.
+    """
+
+    def __init__(self, a: int, b="b"):
+        self.a = a
+        self.b = b
+
+
+@TEST_REGISTRY.register_function("bar")
+def get_bar(x, y=2, **kwargs):
+    """ A test function.
+
+    Args:
+        x (int): Value x.
+        y (int): Value y.
+    """
+    return x + y
+
+
+def test_build():
+    cfg = dict(type="Foo", a=1)
+    foo = TEST_REGISTRY.build(cfg)
+    assert isinstance(foo, Foo)
+    assert foo.a == 1 and foo.b == "b"
+    assert cfg == dict(type="Foo", a=1)
+
+    assert TEST_REGISTRY.build(dict(type="bar", x=1)) == 3
+    assert TEST_REGISTRY.build(dict(type="bar"), x=1, y=1) == 2
+
+
+def test_contains():
+    assert TEST_REGISTRY.contains("Foo")
+    assert TEST_REGISTRY.contains("bar")
+    assert not TEST_REGISTRY.contains("get_bar")
+
+
+def test_fetch_parameters():
+    args = TEST_REGISTRY.fetch_parameters("Foo")
+    assert list(args.keys()) == ["a", "b"]
+    assert args["a"].value == 0
+    assert args["b"].value == "b"
+    assert "Value b." in args["b"].comment
+
+    args = TEST_REGISTRY.fetch_parameters("bar")
+    assert list(args.keys()) == ["x", "y", "kwargs"]
+    assert args["y"].value == 2
+    assert args["kwargs"].value == {}
+
+
+def test_arguments_cache():
+    assert get_class_arguments(Foo) is get_class_arguments(Foo)
+    assert get_function_arguments(get_bar) is get_function_arguments(get_bar)
+
+
+def test_eager_schema(make_registry):
+    registry = make_registry("TEST_EAGER_REGISTRY", lazy_schema=False)
+    registry.register_by_hand(Foo)
+    registry.register_by_hand(get_bar, name="bar")
+    assert "Foo" in registry.class_args_map
+    assert "bar" in registry.func_args_map
+    assert registry.fetch_parameters("Foo") is registry.class_args_map["Foo"]
+
+
+def test_get_with_kind():
+    assert TEST_REGISTRY.get_with_kind("Foo") == (Foo, True)
+    assert TEST_REGISTRY.get_with_kind("bar") == (get_bar, False)
+    assert TEST_REGISTRY.get_with_kind("baz") == (None, False)
+    assert TEST_REGISTRY.get("bar") is get_bar
+
+
+def test_annotation_not_constructed():
+    def func(foo: Foo, n: int, m: List[int], k: Optional[str]):
+        pass
+
+    args = get_function_arguments(func)
+    assert args["foo"].value is None
+    assert args["n"].value == 0
+    assert args["m"].value == []
+    assert args["k"].value is None
+
+
+def test_unhashable_annotation():
+    def func(u: [int], v: {1: int}):
+        pass
+
+    args = get_function_arguments(func)
+    assert args["u"].value is None
+    assert "TODO" in args["u"].comment
+    assert args["v"].value is None
+
+
+def test_build_cfg():
+    foo = TEST_REGISTRY.build_cfg(dict(type="Foo", a=1, b="c"))
+    assert foo.a == 1 and foo.b == "c"
+    assert TEST_REGISTRY.build_cfg(dict(type=get_bar, x=1)) == 3
+
+
+def test_inherited_arguments():
+    class SubFoo(Foo):
+        def __init__(self, c=3, **kwargs):
+            super(SubFoo, self).__init__(**kwargs)
+
+    args = get_class_arguments(SubFoo)
+    assert list(args.keys()) == ["c", "a", "b"]
+    assert args["a"] is get_class_arguments(Foo)["a"]
+
+
+def test_parse_google_params():
+    parser = pytest.importorskip("docstring_parser")
+    from essmc2.utils.registry import _parse_google_params, build_from_config
+
+    for doc in (Foo.__doc__, get_bar.__doc__, build_from_config.__doc__, Registry.__doc__):
+        params = {param.arg_name: param.description for param in parser.parse(doc).params}
+        assert _parse_google_params(doc) == params
+    assert _parse_google_params(":param a: Value a.") is None
+
+
+def test_build_replaced(make_registry):
+    registry = make_registry("TEST_REPLACE_REGISTRY")
+    registry.register_function("f")(lambda: 1)
+    assert registry.build(dict(type="f")) == 1
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        registry.register_by_hand(lambda: 2, name="f")
+    assert registry.build(dict(type="f")) == 2
+
+
+def test_repr():
+    assert repr(TEST_REGISTRY).split('\n')[1:] == [
+        f"\tFoo: {Foo}",
+        f"\tbar: <function '{get_bar.__module__}.get_bar'>",
+    ]
+
+
+def test_build_keeps_nested_config(make_registry):
+    registry = make_registry("TEST_NESTED_REGISTRY")
+    registry.register_by_hand(Foo)
+    cfg = dict(type="Foo", a=dict(type="Foo", a=1), b=[1, 2])
+    foo = registry.build(cfg)
+    foo.a["a"] = 2
+    foo.b.append(3)
+    registry.build(cfg)
+    assert cfg == dict(type="Foo", a=dict(type="Foo", a=2), b=[1, 2, 3])
+
+    class Mutator(object):
+        def __init__(self, sub):
+            registry.build(sub)
+
+    registry.register_by_hand(Mutator)
+    cfg = dict(type="Mutator", sub=dict(type="Foo", a=1))
+    registry.build(cfg)
+    assert cfg == dict(type="Mutator", sub=dict(type="Foo", a=1))
+
+
+def test_build_model_keeps_pretrain(make_registry, monkeypatch):
+    pytest.importorskip("torch")
+    import essmc2.models.registry as model_registry
+
+    loaded = []
+    monkeypatch.setattr(model_registry, "load_pretrained",
+                        lambda model, path, logger=None, **kwargs: loaded.append((path, kwargs)))
+    registry = make_registry("TEST_MODEL_REGISTRY", build_func=model_registry.build_model)
+    registry.register_by_hand(Foo)
+    cfg = dict(type="Foo", a=1, pretrain=dict(path="model.pth", sub_level="backbone"))
+    registry.build(cfg)
+    registry.build(cfg)
+    assert cfg == dict(type="Foo", a=1, pretrain=dict(path="model.pth", sub_level="backbone"))
+    assert loaded == [("model.pth", dict(sub_level="backbone"))] * 2
+
+
+def test_replace_with_other_kind(make_registry):
+    registry = make_registry("TEST_KIND_REGISTRY")
+    registry.register_by_hand(Foo, name="X")
+    assert list(registry.fetch_parameters("X").keys()) == ["a", "b"]
+    with pytest.warns(UserWarning, match="X already registered"):
+        registry.register_by_hand(get_bar, name="X")
+    assert registry.get_with_kind("X") == (get_bar, False)
+    assert "X" not in registry.class_map and "X" not in registry.class_args_map
+    assert list(registry.fetch_parameters("X").keys()) == ["x", "y", "kwargs"]
+    assert registry.build(dict(type="X", x=1)) == 3
+
+
+def test_non_str_name(make_registry):
+    registry = make_registry("TEST_NAME_REGISTRY")
+    registry.register_class(name=1)(Foo)
+    registry.register_function(name=("bar", 2))(get_bar)
+    assert registry.get(1) is Foo
+    assert registry.contains(("bar", 2))
+
+
+def test_missing_docstring_parser(monkeypatch):
+    import essmc2.utils.registry as registry_module
+
+    monkeypatch.setattr(registry_module, "_docstring_parser", None)
+    monkeypatch.setitem(sys.modules, "docstring_parser", None)
+    with pytest.raises(ImportError, match=r"pip install essmc2\[registry\]"):
+        registry_module._get_doc_params(":param a: Value a.")
+
+
+def test_prose_docstring_without_docstring_parser(monkeypatch):
+    import essmc2.utils.registry as registry_module
+
+    monkeypatch.setattr(registry_module, "_docstring_parser", None)
+    monkeypatch.setitem(sys.modules, "docstring_parser", None)
+    assert registry_module._parse_google_params("Base class of all test modules.\n\nNothing documented.") == {}
+
+    class Base(object):
+        """ Base class of test modules, without documented parameters.
+        """
+
+        def __init__(self, d=4):
+            pass
+
+    class Sub(Base, Foo):
+        pass
+
+    assert list(get_class_arguments(Sub).keys()) == ["d", "a", "b"]